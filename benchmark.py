@@ -0,0 +1,464 @@
+"""Benchmark da API contra um Google Trends falso local
+
+Sobe um servidor HTTP que imita os endpoints usados pelo pytrends (latência, rajadas de 429 e
+tamanho de payload configuráveis), inicia main.app com uvicorn apontado para ele e gera carga
+concorrente em cada endpoint. Resultados (vazão, p50/p95/p99, chamadas ao upstream por
+requisição, hit rate e pico de RSS) vão para um JSON que pode ser comparado entre execuções.
+
+    python benchmark.py --requests 300 --concurrency 16 --output bench.json
+    python benchmark.py --compare bench.json
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+import requests
+
+COUNTRIES = ["brazil", "united_states", "japan", "india", "germany", "france", "mexico",
+             "united_kingdom", "canada", "argentina", "spain", "italy"]
+WORDS = ["python", "javascript", "rust", "golang", "kotlin", "swift", "react", "docker",
+         "kubernetes", "linux", "chatgpt", "netflix", "futebol", "receita", "iphone", "android"]
+
+
+def stable_value(*parts) -> int:
+    """Valor 0-100 determinístico por (termo, data): buscas incrementais batem com a completa"""
+    digest = hashlib.md5("|".join(map(str, parts)).encode()).digest()
+    return digest[0] * 100 // 255
+
+
+class FakeTrends:
+    """Estado e configuração do Google falso"""
+
+    def __init__(self, latency: float, jitter: float, throttle_every: int, throttle_burst: int,
+                 regions: int, suggestions: int):
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_every = throttle_every
+        self.throttle_burst = throttle_burst
+        self.regions = regions
+        self.suggestions = suggestions
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.data_requests = 0
+
+    def record(self, kind: str) -> bool:
+        """Conta a requisição; True se ela deve receber 429 (rajada de throttling)"""
+        with self.lock:
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+            if kind == "cookie":
+                return False
+            self.data_requests += 1
+            if self.throttle_every <= 0:
+                return False
+            return self.data_requests % self.throttle_every < self.throttle_burst
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {"data_requests": self.data_requests, **self.counts}
+
+
+def parse_window(timeframe: str) -> tuple:
+    """Janela (início, fim) de um timeframe do pytrends, para gerar um ponto por dia"""
+    today = date.today()
+    if timeframe.startswith("today "):
+        amount, unit = timeframe.split()[1].split("-")
+        days = {"d": 1, "m": 30, "y": 365}[unit] * int(amount)
+        return today - timedelta(days=days), today
+    if timeframe.startswith("now "):
+        return today - timedelta(days=7), today
+    try:
+        start, end = timeframe.split()
+        return date.fromisoformat(start), date.fromisoformat(end)
+    except ValueError:
+        return today - timedelta(days=90), today
+
+
+def make_handler(fake: FakeTrends):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            self.route()
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            if length:
+                self.rfile.read(length)
+            self.route()
+
+        def send_json(self, payload, prefix: str = "", status: int = 200, headers: dict = None):
+            body = (prefix + json.dumps(payload)).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def route(self):
+            url = urlparse(self.path)
+            query = {k: v[0] for k, v in parse_qs(url.query).items()}
+            path = url.path
+            if path.endswith("/explore/"):
+                fake.record("cookie")
+                body = b"ok"
+                self.send_response(200)
+                self.send_header("Set-Cookie", "NID=bench; Path=/")
+                self.send_header("Content-Type", "text/html")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+
+            kind = path.rsplit("/", 1)[-1] or path.rsplit("/", 2)[-2]
+            if "/autocomplete/" in path:
+                kind = "autocomplete"
+            throttled = fake.record(kind)
+            time.sleep(max(0.0, fake.latency + random.uniform(-fake.jitter, fake.jitter)))
+            if throttled:
+                self.send_json({"error": "quota"}, status=429, headers={"Retry-After": "1"})
+                return
+
+            req = json.loads(query.get("req", "{}"))
+            if path.endswith("/api/explore"):
+                self.send_json(self.explore(req), prefix=")]}'")
+            elif path.endswith("/multiline"):
+                self.send_json(self.timeline(req), prefix=")]}',")
+            elif path.endswith("/comparedgeo"):
+                self.send_json(self.geo_map(req), prefix=")]}',")
+            elif path.endswith("/relatedsearches"):
+                self.send_json(self.related(req), prefix=")]}',")
+            elif kind == "autocomplete":
+                keyword = unquote(path.split("/autocomplete/", 1)[1])
+                topics = [{"mid": f"/m/{i}", "title": f"{keyword} {WORDS[i % len(WORDS)]}", "type": "Tópico"}
+                          for i in range(fake.suggestions)]
+                self.send_json({"default": {"topics": topics}}, prefix=")]}',")
+            elif path.endswith("/hottrends/visualize/internal/data"):
+                self.send_json({country: [f"{country} {word}" for word in WORDS] for country in COUNTRIES})
+            else:
+                self.send_json({"error": "not found"}, status=404)
+
+        def explore(self, req: dict) -> dict:
+            items = req.get("comparisonItem", [])
+            widgets = [
+                {"id": "TIMESERIES", "token": "t", "request": {"comparisonItem": items}},
+                {"id": "GEO_MAP", "token": "g", "request": {"comparisonItem": items, "resolution": "COUNTRY"}}
+            ]
+            for item in items:
+                restriction = {"complexKeywordsRestriction": {"keyword": [{"type": "BROAD", "value": item["keyword"]}]}}
+                widgets.append({"id": "RELATED_TOPICS", "token": "rt",
+                                "request": {"restriction": restriction, "keywordType": "ENTITY"}})
+                widgets.append({"id": "RELATED_QUERIES", "token": "rq",
+                                "request": {"restriction": restriction, "keywordType": "QUERY"}})
+            return {"widgets": widgets}
+
+        def timeline(self, req: dict) -> dict:
+            items = req.get("comparisonItem", [])
+            if not items:
+                return {"default": {"timelineData": []}}
+            start, end = parse_window(items[0].get("time", "today 3-m"))
+            points = []
+            day = start
+            while day <= end:
+                timestamp = int(datetime(day.year, day.month, day.day).timestamp())
+                points.append({
+                    "time": str(timestamp),
+                    "formattedTime": day.isoformat(),
+                    "value": [stable_value(item["keyword"], day) for item in items],
+                    "hasData": [True] * len(items)
+                })
+                day += timedelta(days=1)
+            return {"default": {"timelineData": points}}
+
+        def geo_map(self, req: dict) -> dict:
+            items = req.get("comparisonItem", [])
+            count = fake.regions * (10 if req.get("resolution") == "CITY" else 1)
+            rows = [{
+                "geoCode": f"R{i}",
+                "geoName": f"Região {i}",
+                "value": [stable_value(item["keyword"], i) for item in items],
+                "hasData": [True] * len(items)
+            } for i in range(count)]
+            return {"default": {"geoMapData": rows}}
+
+        def related(self, req: dict) -> dict:
+            keyword = req["restriction"]["complexKeywordsRestriction"]["keyword"][0]["value"]
+            if req.get("keywordType") == "ENTITY":
+                ranked = [{"topic": {"mid": f"/m/{i}", "title": f"{word}", "type": "Tópico"}, "value": 100 - i,
+                           "formattedValue": str(100 - i)} for i, word in enumerate(WORDS[:10])]
+            else:
+                ranked = [{"query": f"{keyword} {word}", "value": 100 - i} for i, word in enumerate(WORDS[:10])]
+            return {"default": {"rankedList": [{"rankedKeyword": ranked}, {"rankedKeyword": ranked[:5]}]}}
+
+    return Handler
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def read_rss_kb(pid: int, field: str = "VmRSS") -> int:
+    """Memória residente do processo em KB (Linux); 0 se indisponível"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+class RssSampler:
+    """Amostra o RSS do servidor durante um cenário"""
+
+    def __init__(self, pid: int, interval: float = 0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self.running = False
+        self.thread = None
+
+    def __enter__(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def run(self):
+        while self.running:
+            self.peak = max(self.peak, read_rss_kb(self.pid))
+            time.sleep(self.interval)
+
+    def __exit__(self, *exc):
+        self.running = False
+        self.thread.join()
+
+
+def build_scenarios(keys: int, rng: random.Random) -> dict:
+    """Cenário -> função que gera (método, path, corpo) da i-ésima requisição, com popularidade em cauda longa"""
+    def pick(options):
+        # Zipf aproximado: poucas chaves quentes e uma cauda longa
+        weights = [1 / (i + 1) for i in range(len(options))]
+        return rng.choices(options, weights=weights)[0]
+
+    keyword_sets = [",".join(rng.sample(WORDS, rng.randint(1, 3))) for _ in range(keys)]
+    keywords = [f"{rng.choice(WORDS)} {i}" if i >= len(WORDS) else WORDS[i] for i in range(keys)]
+    prefixes = sorted({word[:length] for word in WORDS for length in (2, 3, 4)})
+
+    return {
+        "trending_searches": lambda: ("GET", f"/trending-searches?country={pick(COUNTRIES)}", None),
+        "interest_over_time": lambda: ("GET", f"/interest-over-time?keywords={pick(keyword_sets)}&timeframe=today 3-m", None),
+        "interest_by_region": lambda: ("GET", f"/interest-by-region?keyword={pick(keywords)}&resolution=CITY&geo=US&limit=50", None),
+        "related_queries": lambda: ("GET", f"/related-queries?keyword={pick(keywords)}", None),
+        "suggestions": lambda: ("GET", f"/suggestions?keyword={pick(keywords + prefixes)}", None)
+    }
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def run_scenario(base_url: str, name: str, make_request, total: int, concurrency: int,
+                 fake: FakeTrends, server_pid: int) -> dict:
+    """Dispara `total` requisições com `concurrency` clientes e mede o cenário"""
+    requests.get(f"{base_url}/cache/clear", timeout=10)
+    planned = [make_request() for _ in range(total)]
+    local = threading.local()
+    latencies, statuses, from_cache = [], {}, [0]
+    lock = threading.Lock()
+
+    def send(spec):
+        method, path, body = spec
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        started = time.perf_counter()
+        try:
+            response = session.request(method, base_url + path, json=body, timeout=120)
+            status = response.status_code
+            cached = status == 200 and response.json().get("from_cache") is True
+        except requests.RequestException:
+            status, cached = "error", False
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            from_cache[0] += cached
+
+    upstream_before = fake.snapshot()
+    fetches_before = requests.get(f"{base_url}/cache/stats", timeout=10).json()["single_flight"]["upstream_calls"]
+    with RssSampler(server_pid) as rss, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        started = time.perf_counter()
+        list(pool.map(send, planned))
+        wall = time.perf_counter() - started
+    upstream_after = fake.snapshot()
+    fetches_after = requests.get(f"{base_url}/cache/stats", timeout=10).json()["single_flight"]["upstream_calls"]
+
+    latencies.sort()
+    http_calls = upstream_after["data_requests"] - upstream_before["data_requests"]
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(total / wall, 2) if wall else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50) * 1000, 2),
+            "p95": round(percentile(latencies, 0.95) * 1000, 2),
+            "p99": round(percentile(latencies, 0.99) * 1000, 2),
+            "max": round(latencies[-1] * 1000, 2) if latencies else 0.0
+        },
+        "status_codes": statuses,
+        "cache_hit_rate": round(from_cache[0] / total, 4) if total else 0.0,
+        "upstream_fetches": fetches_after - fetches_before,
+        "upstream_http_requests": http_calls,
+        "upstream_calls_per_request": round(http_calls / total, 4) if total else 0.0,
+        "peak_rss_mb": round(rss.peak / 1024, 1)
+    }
+
+
+def start_app(port: int, trends_url: str, args) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "TRENDS_BASE_URL": trends_url,
+        "UPSTREAM_QPS": str(args.upstream_qps),
+        "UPSTREAM_BURST": str(args.upstream_burst),
+        "UPSTREAM_QUEUE_MAX": str(args.upstream_queue_max),
+        "CLIENT_QUOTA_PER_MINUTE": str(args.client_quota_per_minute),
+        "CLIENT_QUOTA_BURST": str(args.client_quota_burst),
+        "CLIENT_QUEUE_MAX": str(args.client_queue_max),
+        "CIRCUIT_BREAKER_TIMEOUT": str(args.breaker_timeout),
+        "CACHE_SNAPSHOT_PATH": "",
+        "REDIS_URL": os.environ.get("REDIS_URL", ""),
+        "PREWARM_PINS_FILE": ""
+    }
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=app_dir, env=env
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("uvicorn terminou durante a inicialização")
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                return process
+        except requests.RequestException:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("uvicorn não respondeu em 30 s")
+
+
+def compare(current: dict, baseline: dict, baseline_path: str):
+    """Imprime a variação de vazão e p95 em relação a um resultado anterior"""
+    print(f"\nComparação com {baseline_path}:")
+    for name, result in current["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        def delta(new, old):
+            return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+        print(f"  {name:20} vazão {delta(result['throughput_rps'], previous['throughput_rps']):>8}  "
+              f"p95 {delta(result['latency_ms']['p95'], previous['latency_ms']['p95']):>8}  "
+              f"upstream/req {previous['upstream_calls_per_request']} -> {result['upstream_calls_per_request']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da Google Trends API contra um Google falso local")
+    parser.add_argument("--scenarios", default="all", help="cenários separados por vírgula (padrão: todos)")
+    parser.add_argument("--requests", type=int, default=200, help="requisições por cenário")
+    parser.add_argument("--concurrency", type=int, default=16, help="clientes simultâneos")
+    parser.add_argument("--keys", type=int, default=20, help="chaves distintas por cenário (cauda longa)")
+    parser.add_argument("--latency", type=float, default=0.05, help="latência do Google falso (s)")
+    parser.add_argument("--jitter", type=float, default=0.02, help="variação da latência (s)")
+    parser.add_argument("--throttle-every", type=int, default=0, help="a cada N chamadas de dados, uma rajada de 429 (0 desliga)")
+    parser.add_argument("--throttle-burst", type=int, default=3, help="tamanho da rajada de 429")
+    parser.add_argument("--regions", type=int, default=50, help="regiões por resposta de interest_by_region (CITY: 10x)")
+    parser.add_argument("--suggestions", type=int, default=5, help="sugestões por resposta do autocomplete")
+    parser.add_argument("--upstream-qps", type=float, default=1000.0, help="UPSTREAM_QPS da API (produção: 0.2)")
+    parser.add_argument("--upstream-burst", type=int, default=1000, help="UPSTREAM_BURST da API")
+    parser.add_argument("--upstream-queue-max", type=int, default=10000, help="UPSTREAM_QUEUE_MAX da API")
+    parser.add_argument("--client-quota-per-minute", type=float, default=1e6, help="CLIENT_QUOTA_PER_MINUTE da API (produção: 6)")
+    parser.add_argument("--client-quota-burst", type=int, default=10000, help="CLIENT_QUOTA_BURST da API")
+    parser.add_argument("--client-queue-max", type=int, default=10000, help="CLIENT_QUEUE_MAX da API (todo o benchmark é um cliente só)")
+    parser.add_argument("--breaker-timeout", type=float, default=1.0, help="CIRCUIT_BREAKER_TIMEOUT da API (s)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="benchmark_results.json", help="arquivo JSON de saída")
+    parser.add_argument("--compare", help="JSON de uma execução anterior para comparar")
+    args = parser.parse_args()
+
+    # Lido antes de rodar: --compare e --output podem ser o mesmo arquivo
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    rng = random.Random(args.seed)
+    random.seed(args.seed)
+    fake = FakeTrends(args.latency, args.jitter, args.throttle_every, args.throttle_burst,
+                      args.regions, args.suggestions)
+    fake_server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(fake))
+    threading.Thread(target=fake_server.serve_forever, daemon=True).start()
+    trends_url = f"http://127.0.0.1:{fake_server.server_port}/trends"
+
+    port = free_port()
+    app = start_app(port, trends_url, args)
+    base_url = f"http://127.0.0.1:{port}"
+    scenarios = build_scenarios(args.keys, rng)
+    selected = list(scenarios) if args.scenarios == "all" else args.scenarios.split(",")
+
+    results = {}
+    try:
+        for name in selected:
+            results[name] = run_scenario(base_url, name, scenarios[name], args.requests, args.concurrency, fake, app.pid)
+            r = results[name]
+            print(f"{name:20} {r['throughput_rps']:8.1f} req/s  p50 {r['latency_ms']['p50']:8.1f} ms  "
+                  f"p95 {r['latency_ms']['p95']:8.1f} ms  p99 {r['latency_ms']['p99']:8.1f} ms  "
+                  f"hit {r['cache_hit_rate']:.2%}  upstream/req {r['upstream_calls_per_request']:.3f}  "
+                  f"rss {r['peak_rss_mb']} MB")
+        peak_rss_mb = round(read_rss_kb(app.pid, "VmHWM") / 1024, 1)
+    finally:
+        app.terminate()
+        app.wait(timeout=10)
+        fake_server.shutdown()
+
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "config": vars(args),
+        "python": sys.version.split()[0],
+        "peak_rss_mb": peak_rss_mb,
+        "upstream_requests_by_kind": fake.snapshot(),
+        "scenarios": results
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResultados salvos em {args.output} (pico de RSS do servidor: {peak_rss_mb} MB)")
+    if baseline is not None:
+        compare(report, baseline, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""/advanced-trends pelo caminho real (sem mock), com um TrendReq falso no pool"""
+import os
+import subprocess
+import sys
+import textwrap
+from collections import deque
+
+os.environ.update(CACHE_SNAPSHOT_PATH="", PREWARM_PINS_FILE="", MOCK_LATENCY="0", UPSTREAM_PRELOAD="false")
+
+import numpy as np
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+# Mesmo formato da resposta do Google: uma lista de termos por nome de país
+TRENDING = {
+    "united_states": ["alpha", "beta", "gamma", "delta", "epsilon", "zeta"],
+    "brazil": ["copa", "novela"]
+}
+
+
+class FakeTrendReq:
+    calls = []
+
+    def __init__(self, *args, **kwargs):
+        self.keywords, self.geo = [], ""
+
+    def trending_searches(self, pn="united_states"):
+        FakeTrendReq.calls.append(("trending_searches", pn))
+        return pd.DataFrame(TRENDING[pn])
+
+    def build_payload(self, kw_list, timeframe="today 5-y", geo="", **kwargs):
+        self.keywords, self.geo = list(kw_list), geo
+
+    def interest_over_time(self):
+        FakeTrendReq.calls.append(("interest_over_time", self.geo))
+        index = pd.date_range("2026-01-01", periods=30, freq="D", name="date")
+        # Cada termo cresce num ritmo diferente; o último trecho sobe bem acima do baseline
+        frame = pd.DataFrame({
+            keyword: np.r_[np.full(22, 10 + i), np.linspace(20, 60 + 10 * i, 8)]
+            for i, keyword in enumerate(self.keywords)
+        }, index=index).round().astype(int)
+        frame["isPartial"] = False
+        return frame
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(main.trendreq_pool, "factory", FakeTrendReq)
+    monkeypatch.setattr(main.trendreq_pool, "idle", deque())
+    FakeTrendReq.calls = []
+    main.cache.clear()
+    main.circuit_breakers.clear()
+    scheduler = main.upstream_scheduler
+    scheduler.rate, scheduler.burst, scheduler.tokens = 100, 10, 10
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+def test_default_region_runs_real_analysis(client):
+    response = client.get("/advanced-trends", params={"min_growth": 0})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["metadata"]["is_mock"] is False
+    assert body["metadata"]["topics_analyzed"] == len(TRENDING["united_states"])
+    trends = body["data"]["trends"]
+    assert trends and all(trend["growth"] > 0 for trend in trends)
+    # Código do país nas séries, nome do país nas trending searches
+    assert ("trending_searches", "united_states") in FakeTrendReq.calls
+    assert {geo for call, geo in FakeTrendReq.calls if call == "interest_over_time"} == {"US"}
+    assert main.get_circuit_breaker("trending_searches").state == "closed"
+
+    cached = client.get("/advanced-trends", params={"min_growth": 0}).json()
+    assert cached["metadata"]["from_cache"] is True
+    assert [t["topic"] for t in cached["data"]["trends"]] == [t["topic"] for t in trends]
+
+
+def test_unknown_region_is_rejected_without_touching_the_breaker(client):
+    for _ in range(3):
+        assert client.get("/advanced-trends", params={"region": "XX"}).status_code == 422
+    assert FakeTrendReq.calls == []
+    assert main.get_circuit_breaker("trending_searches").state == "closed"
+
+
+def test_unknown_country_is_not_an_upstream_failure(client):
+    for _ in range(3):
+        assert client.get("/trending-searches", params={"country": "atlantis"}).status_code == 422
+    assert main.get_circuit_breaker("trending_searches").state == "closed"
+    body = client.get("/trending-searches", params={"country": "brazil"}).json()
+    assert body["is_mock"] is False
+    assert body["trending_searches"] == TRENDING["brazil"]
+
+
+def test_cached_trending_does_not_take_the_half_open_probe(client):
+    country = main.TRENDING_COUNTRIES["US"]
+    key = main.get_cache_key("trending_searches", {"country": country})
+    trending = {"country": country, "trending_searches": TRENDING[country], "timestamp": "", "is_mock": False}
+    main.cache.set(key, main.CachedPayload.from_data(trending), 900)
+    breaker = main.get_circuit_breaker("trending_searches")
+    breaker.state, breaker.open_until = "open", 0.0
+
+    body = client.get("/advanced-trends", params={"min_growth": 0}).json()
+    assert body["metadata"]["is_mock"] is False
+    assert ("trending_searches", country) not in FakeTrendReq.calls
+    # A sonda continua livre para a próxima busca real
+    assert breaker.allow() is True
+
+
+def test_mock_and_cached_analysis_do_not_import_numpy():
+    # Processo separado: aqui o numpy já foi importado pelo próprio teste
+    script = textwrap.dedent("""
+        import sys
+        import main
+        from fastapi.testclient import TestClient
+        analysis = {"topics": ["a", "b"], "growth": [10.0, 300.0], "status": ["STABLE", "EXPLODING"],
+                    "interest": [1.0, 2.0], "z_score": [0.1, 4.0], "slope": [0.1, 2.0],
+                    "anchor": "a", "failed_topics": [], "computed_at": ""}
+        key = main.get_cache_key("advanced_trends", {"region": "US", "time_range": "30d", "limit": main.ADVANCED_TOPICS_DEFAULT})
+        main.cache.set(key, main.CachedPayload.from_data(analysis), 900)
+        client = TestClient(main.app)
+        assert client.get("/advanced-trends", params={"use_mock": "true"}).status_code == 200
+        assert [t["topic"] for t in client.get("/advanced-trends", params={"min_growth": 20}).json()["data"]["trends"]] == ["b"]
+        print("numpy" in sys.modules)
+    """)
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), env=os.environ)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip().splitlines()[-1] == "False"
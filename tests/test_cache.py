@@ -0,0 +1,22 @@
+"""TrendsCache: limites de entradas e de bytes, contando as renderizações derivadas"""
+import os
+
+os.environ.update(CACHE_SNAPSHOT_PATH="", PREWARM_PINS_FILE="", MOCK_LATENCY="0", UPSTREAM_PRELOAD="false")
+
+import main
+
+
+def test_variants_count_against_the_byte_budget():
+    cache = main.TrendsCache(max_entries=10, max_bytes=2000)
+    for key in ("a", "b", "c"):
+        cache.set(key, {"value": key * 400}, 3600)
+    assert cache.total_bytes <= 2000
+    assert len(cache) == 3
+
+    # A mais recente ganha uma renderização grande: as menos usadas saem para caber no orçamento
+    payload = cache.get("c")
+    cache.add_variant("c", payload, "layout", b"x" * 1200)
+    assert cache.total_bytes <= 2000
+    assert "a" not in cache.entries and "c" in cache.entries
+    assert cache.stats["evictions"] >= 1
+    assert cache.total_bytes == sum(entry[3] for entry in cache.entries.values())
@@ -0,0 +1,83 @@
+"""Chaves por dia de timeframes relativos: a entrada de ontem segue como stale; TTL pela janela resolvida"""
+import os
+
+os.environ.update(CACHE_SNAPSHOT_PATH="", PREWARM_PINS_FILE="", MOCK_LATENCY="0", UPSTREAM_PRELOAD="false")
+
+import asyncio
+from collections import deque
+from datetime import date
+
+import pytest
+from fastapi import BackgroundTasks
+from fastapi.testclient import TestClient
+
+import main
+
+
+def frozen_day(day: date):
+    class FrozenDate(date):
+        @classmethod
+        def today(cls):
+            return cls(day.year, day.month, day.day)
+    return FrozenDate
+
+
+class FailingTrendReq:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def build_payload(self, *args, **kwargs):
+        raise RuntimeError("Google indisponível")
+
+
+@pytest.fixture
+def yesterday_entry(monkeypatch):
+    """Entrada de interest_by_region (today 3-m) gravada ontem; o teste roda no dia seguinte"""
+    main.cache.clear()
+    main.circuit_breakers.clear()
+    params = main.canonical_params({"keyword": "futebol", "geo": "BR", "resolution": "REGION", "timeframe": "today 3-m"})
+    monkeypatch.setattr(main, "date", frozen_day(date(2026, 3, 9)))
+    old_key = main.get_cache_key("interest_by_region", params)
+    data = {"keyword": "futebol", "geo": "BR", "resolution": "REGION", "timeframe": "today 3-m",
+            "geo_codes": ["BR-SP"], "geo_names": ["São Paulo"], "values": [100], "is_mock": False}
+    main.cache.set(old_key, main.CachedPayload.from_data(data), 3600)
+    monkeypatch.setattr(main, "date", frozen_day(date(2026, 3, 10)))
+    return params, old_key
+
+
+def test_previous_day_entry_is_served_stale_and_revalidated(yesterday_entry):
+    params, old_key = yesterday_entry
+    key = main.get_cache_key("interest_by_region", params)
+    assert key != old_key
+
+    stale = asyncio.run(main.serve_stale(key))
+    assert stale is not None and stale.stale and stale.data()["geo_names"] == ["São Paulo"]
+
+    background = BackgroundTasks()
+    hit = asyncio.run(main.serve_from_cache(key, lambda *args: None, (), 3600, background))
+    assert hit is not None and hit.stale
+    assert [task.args[0] for task in background.tasks] == [key]
+
+
+def test_upstream_error_after_midnight_serves_yesterday_instead_of_mock(yesterday_entry, monkeypatch):
+    params, old_key = yesterday_entry
+    # Velha demais para o stale-while-revalidate: só volta como fallback do erro
+    payload = main.cache.lookup(old_key)[0]
+    main.cache.set(old_key, payload, -(main.CACHE_SWR_WINDOW + 60), 24 * 3600)
+    monkeypatch.setattr(main.trendreq_pool, "factory", FailingTrendReq)
+    monkeypatch.setattr(main.trendreq_pool, "idle", deque())
+    with TestClient(main.app) as client:
+        body = client.get("/interest-by-region", params={"keyword": "futebol", "geo": "BR", "timeframe": "today 3-m"}).json()
+    assert body.get("is_mock") is False
+    assert body["stale"] is True
+    assert [region["geo_name"] for region in body["regions"]] == ["São Paulo"]
+
+
+def test_equivalent_timeframes_share_the_ttl(monkeypatch):
+    monkeypatch.setattr(main, "date", frozen_day(date(2026, 3, 10)))
+    ttl = lambda timeframe: main.get_cache_ttl("interest_time", {"timeframe": timeframe})
+    assert ttl("today 12-m") == ttl("2025-03-10 2026-03-10") == 6 * 3600
+    assert ttl("today 5-y") == ttl("2021-03-10 2026-03-10") == 12 * 3600
+    assert ttl("all") == 24 * 3600
+    assert ttl("today 3-m") == main.CACHE_TTLS["interest_time"]
+    assert ttl("now 1-H") == 300
@@ -0,0 +1,96 @@
+"""CircuitBreaker: abertura por taxa de erro, half-open com uma sonda, backoff e Retry-After"""
+import os
+
+os.environ.update(CACHE_SNAPSHOT_PATH="", PREWARM_PINS_FILE="", MOCK_LATENCY="0", UPSTREAM_PRELOAD="false")
+
+from types import SimpleNamespace
+
+import pytest
+from pytrends import exceptions as pytrends_exceptions
+
+import main
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(main, "time", SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+
+@pytest.fixture
+def breaker(clock):
+    return main.CircuitBreaker("teste", window=60, min_calls=4, error_rate=0.5, base_timeout=10, max_timeout=300)
+
+
+def throttled(retry_after: str):
+    response = SimpleNamespace(status_code=429, headers={"Retry-After": retry_after})
+    return pytrends_exceptions.TooManyRequestsError("429", response)
+
+
+def test_opens_on_error_rate_then_half_open_probe_closes(breaker, clock):
+    breaker.record_success()
+    breaker.record_success()
+    breaker.record_failure(RuntimeError())
+    assert breaker.state == "closed"
+    breaker.record_failure(RuntimeError())
+    assert breaker.state == "open"
+    assert breaker.allow() is False
+
+    clock.now += 10
+    # Half-open: só a sonda passa
+    assert breaker.allow() is True
+    assert breaker.state == "half_open"
+    assert breaker.allow() is False
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow() is True and breaker.allow() is True
+
+
+def test_failed_probe_doubles_the_open_time(breaker, clock):
+    breaker.record_failure(throttled("0"))
+    assert breaker.state == "open"
+    assert breaker.open_until == clock.now + 10
+
+    clock.now += 10
+    assert breaker.allow() is True
+    breaker.record_failure(RuntimeError())
+    assert breaker.state == "open"
+    assert breaker.open_until == clock.now + 20
+
+
+def test_retry_after_extends_the_backoff_up_to_the_max(breaker, clock):
+    breaker.record_failure(throttled("120"))
+    assert breaker.open_until == clock.now + 120
+
+    clock.now += 120
+    assert breaker.allow() is True
+    breaker.record_failure(throttled("3600"))
+    assert breaker.open_until == clock.now + 300
+
+
+def test_probe_is_not_reclaimed_while_it_may_still_be_queued_or_running(breaker, clock):
+    breaker.record_failure(throttled("0"))
+    clock.now += 10
+    assert breaker.allow() is True
+    # Até UPSTREAM_TIMEOUT na fila mais UPSTREAM_TIMEOUT na chamada
+    clock.now += 1.5 * main.UPSTREAM_TIMEOUT
+    assert breaker.allow() is False
+    clock.now += main.UPSTREAM_TIMEOUT
+    assert breaker.allow() is True
+
+
+def test_released_probe_lets_the_next_caller_try(breaker, clock):
+    breaker.record_failure(throttled("0"))
+    clock.now += 10
+    assert breaker.allow() is True
+    breaker.release_probe()
+    assert breaker.allow() is True
@@ -0,0 +1,90 @@
+"""Cliente que desconecta no meio da busca cancela a busca compartilhada (passando pelos middlewares)"""
+import os
+
+os.environ.update(CACHE_SNAPSHOT_PATH="", PREWARM_PINS_FILE="", MOCK_LATENCY="0", UPSTREAM_PRELOAD="false")
+
+import asyncio
+import threading
+import time
+from collections import deque
+
+import pandas as pd
+import pytest
+
+import main
+
+
+class SlowTrendReq:
+    started = threading.Event()
+    release = threading.Event()
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def trending_searches(self, pn="united_states"):
+        SlowTrendReq.started.set()
+        SlowTrendReq.release.wait(10)
+        return pd.DataFrame(["tarde demais"])
+
+
+@pytest.fixture
+def slow_upstream(monkeypatch):
+    monkeypatch.setattr(main.trendreq_pool, "factory", SlowTrendReq)
+    monkeypatch.setattr(main.trendreq_pool, "idle", deque())
+    monkeypatch.setattr(main, "DISCONNECT_POLL_INTERVAL", 0.05)
+    SlowTrendReq.started.clear()
+    SlowTrendReq.release.clear()
+    main.cache.clear()
+    main.circuit_breakers.clear()
+    yield
+    SlowTrendReq.release.set()
+    # A chamada segue na thread depois do cancelamento: espera ela devolver a sessão a este pool
+    for _ in range(500):
+        if main.trendreq_pool.in_use == 0:
+            break
+        time.sleep(0.01)
+
+
+def http_scope(path: str, query: str) -> dict:
+    return {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "query_string": query.encode(), "root_path": "",
+        "headers": [(b"host", b"testserver")], "client": ("127.0.0.1", 50000), "server": ("testserver", 80)
+    }
+
+
+def test_disconnect_cancels_the_flight(slow_upstream):
+    async def scenario():
+        disconnected = asyncio.Event()
+        request_sent = False
+        messages = []
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            messages.append(message)
+
+        key = main.get_cache_key("trending_searches", main.canonical_params({"country": "brazil"}))
+        app_task = asyncio.ensure_future(main.app(http_scope("/trending-searches", "country=brazil"), receive, send))
+        for _ in range(500):
+            if key in main.inflight:
+                break
+            await asyncio.sleep(0.01)
+        flight = main.inflight[key]["task"]
+        await asyncio.get_running_loop().run_in_executor(None, SlowTrendReq.started.wait, 5)
+
+        disconnected.set()
+        await asyncio.wait_for(app_task, timeout=5)
+        await asyncio.sleep(0)
+        return flight, messages
+
+    flight, messages = asyncio.run(scenario())
+    assert flight.cancelled()
+    assert messages[0]["status"] == 499
+    assert main.get_circuit_breaker("trending_searches").state == "closed"
@@ -0,0 +1,64 @@
+"""/interest-by-region: resolução padrão por geo e quando ela vai direto no widget do pytrends"""
+import os
+
+os.environ.update(CACHE_SNAPSHOT_PATH="", PREWARM_PINS_FILE="", MOCK_LATENCY="0", UPSTREAM_PRELOAD="false")
+
+from collections import deque
+
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+class RegionTrendReq:
+    calls = []
+
+    def __init__(self, *args, **kwargs):
+        self.geo = ""
+
+    def build_payload(self, kw_list, timeframe="today 5-y", geo="", **kwargs):
+        self.keyword, self.geo = kw_list[0], geo
+        # Como no Google: dentro de um país o widget já vem em REGION
+        self.interest_by_region_widget = {"request": {"resolution": "REGION" if geo else "COUNTRY"}}
+
+    def interest_by_region(self, resolution="COUNTRY", inc_low_vol=False, inc_geo_code=False):
+        # Mesma regra do pytrends: só repassa a resolução para geo vazio ou US
+        if self.geo == "" or (self.geo == "US" and resolution in ("DMA", "CITY", "REGION")):
+            self.interest_by_region_widget["request"]["resolution"] = resolution
+        RegionTrendReq.calls.append((self.geo, self.interest_by_region_widget["request"]["resolution"]))
+        return pd.DataFrame({self.keyword: [80, 100], "geoCode": ["BR-SP", "BR-RJ"]},
+                            index=pd.Index(["São Paulo", "Rio de Janeiro"], name="geoName"))
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(main.trendreq_pool, "factory", RegionTrendReq)
+    monkeypatch.setattr(main.trendreq_pool, "idle", deque())
+    RegionTrendReq.calls = []
+    main.cache.clear()
+    main.circuit_breakers.clear()
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+@pytest.mark.parametrize("resolution", [None, "COUNTRY", "REGION"])
+def test_country_geo_keeps_region_resolution(client, resolution):
+    params = {"keyword": "futebol", "geo": "BR"}
+    if resolution:
+        params["resolution"] = resolution
+    body = client.get("/interest-by-region", params=params).json()
+    assert RegionTrendReq.calls == [("BR", "REGION")]
+    assert body["resolution"] == "REGION"
+
+
+def test_explicit_city_goes_to_the_widget(client):
+    client.get("/interest-by-region", params={"keyword": "futebol", "geo": "BR", "resolution": "CITY"})
+    assert RegionTrendReq.calls == [("BR", "CITY")]
+
+
+def test_worldwide_defaults_to_country(client):
+    body = client.get("/interest-by-region", params={"keyword": "futebol"}).json()
+    assert RegionTrendReq.calls == [("", "COUNTRY")]
+    assert body["resolution"] == "COUNTRY"
@@ -0,0 +1,47 @@
+"""Pins do prewarm: exigem o token de admin e têm limite de chaves"""
+import os
+
+os.environ.update(CACHE_SNAPSHOT_PATH="", PREWARM_PINS_FILE="", MOCK_LATENCY="0", UPSTREAM_PRELOAD="false")
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+PIN = {"endpoint": "trending_searches", "params": {"country": "brazil"}}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(main.settings, "admin_token", "segredo")
+    monkeypatch.setattr(main.prewarm, "pins", set())
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+def test_pins_require_admin_token(client):
+    assert client.post("/prewarm/pins", json=PIN).status_code == 401
+    assert client.post("/prewarm/pins", json=PIN, headers={"X-Admin-Token": "errado"}).status_code == 401
+    assert main.prewarm.pins == set()
+
+    key = client.post("/prewarm/pins", json=PIN, headers={"X-Admin-Token": "segredo"}).json()["key"]
+    assert client.delete(f"/prewarm/pins/{key}").status_code == 401
+    assert key in main.prewarm.pins
+    assert client.delete(f"/prewarm/pins/{key}", headers={"X-Admin-Token": "segredo"}).status_code == 200
+
+
+def test_pins_disabled_without_admin_token(client, monkeypatch):
+    monkeypatch.setattr(main.settings, "admin_token", "")
+    assert client.post("/prewarm/pins", json=PIN).status_code == 403
+
+
+def test_pin_limit(client, monkeypatch):
+    monkeypatch.setattr(main.prewarm, "max_pins", 2)
+    headers = {"X-Admin-Token": "segredo"}
+    for country in ("brazil", "japan"):
+        pin = {"endpoint": "trending_searches", "params": {"country": country}}
+        assert client.post("/prewarm/pins", json=pin, headers=headers).status_code == 200
+    assert client.post("/prewarm/pins", json={**PIN, "params": {"country": "france"}}, headers=headers).status_code == 422
+    # Fixar de novo uma chave já fixada não conta contra o limite
+    assert client.post("/prewarm/pins", json=PIN, headers=headers).status_code == 200
+    assert len(main.prewarm.pins) == 2
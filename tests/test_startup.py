@@ -0,0 +1,13 @@
+"""Imports adiados: sem REDIS_URL o cliente Redis não é importado"""
+import os
+import subprocess
+import sys
+
+
+def test_redis_client_is_not_imported_without_redis_url():
+    script = "import sys, main; print(any(name.split('.')[0] == 'redis' for name in sys.modules))"
+    env = {**os.environ, "REDIS_URL": "", "CACHE_SNAPSHOT_PATH": "", "PREWARM_PINS_FILE": "", "UPSTREAM_PRELOAD": "false"}
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, env=env,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip().splitlines()[-1] == "False"
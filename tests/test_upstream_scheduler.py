@@ -0,0 +1,123 @@
+"""Fila do upstream: justiça entre clientes, promoção de buscas agrupadas e cota de quem iniciou a busca"""
+import os
+
+os.environ.update(CACHE_SNAPSHOT_PATH="", PREWARM_PINS_FILE="", MOCK_LATENCY="0", UPSTREAM_PRELOAD="false")
+
+import asyncio
+
+import pytest
+from fastapi import Request
+
+import main
+
+INTERACTIVE, PREFETCH = main.PRIORITY_INTERACTIVE, main.PRIORITY_PREFETCH
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    """Fila parada (sem tokens) até release()"""
+    upstream = main.upstream_scheduler
+    for name, value in {"rate": 0.001, "burst": 10, "tokens": 0.0, "max_queue": 10, "client_queue_max": 5,
+                        "virtual_time": 0.0, "finish_tags": {}, "queued": {}}.items():
+        monkeypatch.setattr(upstream, name, value)
+    monkeypatch.setattr(main, "inflight", {})
+    main.circuit_breakers.clear()
+    return upstream
+
+
+def release(upstream):
+    upstream.rate, upstream.tokens = 1000.0, 10.0
+    upstream.wakeup.set()
+
+
+def request_from(ip: str) -> Request:
+    async def receive():
+        await asyncio.sleep(3600)
+    return Request({"type": "http", "headers": [], "client": (ip, 50000)}, receive)
+
+
+def fetch(ip: str):
+    return asyncio.ensure_future(main.fetch_shared("test:key", lambda: {"ok": True}, request=request_from(ip),
+                                                   cache_result=False))
+
+
+def test_fair_queue_interleaves_clients(scheduler):
+    async def scenario():
+        order = []
+
+        async def call(client):
+            await scheduler.acquire(INTERACTIVE, client)
+            order.append(client)
+
+        calls = [asyncio.ensure_future(call("a")) for _ in range(4)]
+        await asyncio.sleep(0)
+        calls.append(asyncio.ensure_future(call("b")))
+        await asyncio.sleep(0.01)
+        release(scheduler)
+        await asyncio.gather(*calls)
+        return order
+
+    # "b" chegou depois das 4 chamadas de "a", mas não espera por todas elas
+    assert asyncio.run(scenario()) == ["a", "b", "a", "a", "a"]
+
+
+def test_promoted_call_keeps_its_place(scheduler):
+    async def scenario():
+        order = []
+        ticket = {"priority": PREFETCH}
+
+        async def call(name, priority, call_ticket=None):
+            await scheduler.acquire(priority, None, 1.0, call_ticket)
+            order.append(name)
+
+        calls = [asyncio.ensure_future(call("prefetch", PREFETCH, ticket))]
+        await asyncio.sleep(0)
+        calls.append(asyncio.ensure_future(call("interactive", INTERACTIVE)))
+        await asyncio.sleep(0)
+        scheduler.promote(ticket, INTERACTIVE)
+        release(scheduler)
+        await asyncio.gather(*calls)
+        return order
+
+    assert asyncio.run(scenario()) == ["prefetch", "interactive"]
+
+
+def test_joiner_within_quota_promotes_spare_flight_out_of_eviction(scheduler, monkeypatch):
+    monkeypatch.setattr(main.client_quotas, "admit", lambda client: client != "ip:a")
+    monkeypatch.setattr(scheduler, "max_queue", 2)
+
+    async def scenario():
+        over_quota, within_quota = fetch("a"), fetch("b")
+        await asyncio.sleep(0.01)
+        priorities = [entry[0] for entry in main.request_queue]
+        # Fila cheia: a chamada interativa só entraria despejando uma chamada da capacidade ociosa
+        fillers = [asyncio.ensure_future(scheduler.acquire(INTERACTIVE, "ip:c")) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        release(scheduler)
+        results = await asyncio.gather(over_quota, within_quota, *fillers, return_exceptions=True)
+        return priorities, results
+
+    priorities, results = asyncio.run(scenario())
+    assert priorities == [INTERACTIVE]
+    assert results[:2] == [{"ok": True}, {"ok": True}]
+    assert sum(isinstance(result, main.UpstreamQueueFull) for result in results[2:]) == 1
+    assert scheduler.stats["promoted"] >= 1
+
+
+def test_owner_quota_error_is_not_passed_to_joiners(scheduler, monkeypatch):
+    monkeypatch.setattr(scheduler, "client_queue_max", 1)
+
+    async def scenario():
+        # "a" já tem o máximo de chamadas na fila
+        blocker = asyncio.ensure_future(scheduler.acquire(INTERACTIVE, "ip:a"))
+        await asyncio.sleep(0)
+        owner, joiner = fetch("a"), fetch("b")
+        await asyncio.sleep(0.01)
+        release(scheduler)
+        results = await asyncio.gather(owner, joiner, return_exceptions=True)
+        await blocker
+        return results
+
+    owner, joiner = asyncio.run(scenario())
+    assert isinstance(owner, main.ClientQuotaExceeded)
+    assert joiner == {"ok": True}